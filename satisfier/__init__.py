@@ -1,4 +1,4 @@
 # flake8: noqa
 from .heuristics import tabu
-from .enumerative import search, solutions
+from .enumerative import optimize, prepare, search, solutions
 from .system import ConstraintSystem
@@ -1,8 +1,10 @@
+import multiprocessing
+
 from collections import defaultdict
 
-from typing import Any, Dict, Iterator, Set, Tuple
+from typing import Any, Callable, Dict, FrozenSet, Iterable, Iterator, List, Mapping, Optional, Set, Tuple
 
-from satisfier.system import ConstraintSystem, Constraint, Variable
+from satisfier.system import ConstraintSystem, Constraint, Expression, Variable
 
 
 # Type aliases
@@ -10,32 +12,188 @@ Domain = Dict[Variable, Set[Any]]
 Assignment = Dict[Variable, Any]
 
 
-def solutions(system: ConstraintSystem) -> Iterator[Assignment]:
-    """Yields all solutions to the given constraint system.
+class PreparedSystem:
+    """A constraint system compiled once so that it can be solved repeatedly.
 
-    Implements backtracking with domain reduction to find all solutions to the
-    constraint system.
+    The constraint, variable and domain sets are snapshotted and each variable
+    is indexed to the constraints it appears in, so that solving a variant of
+    the system only needs to merge in the overridden domains rather than
+    rebuilding the system. The index lets the search update the constraints
+    that are one variable away from being checked incrementally, instead of
+    scanning every unsatisfied constraint at each step.
 
-    Example:
-    >>> C = ConstraintSystem()
-    >>> x = C.variable_set
-    >>> C.add_constraints([
-    ...     x[0] < x[1],
-    ...     x[0]**2 + x[1]**2 == x[2]**2
-    ... ])
-    ...
-    >>> for variable in C.variables:
-    ...     C.set_domain(variable, range(1, 20))
-    ...
-    >>> for solution in all_solutions(C):
-    ...     print(solution)
-    ...
-    [3, 4, 5]
-    [6, 8, 10]
-    [5, 12, 13]
-    [9, 12, 15]
-    [8, 15, 17]
+    Constants that change between variants can be modelled as variables with
+    a single-valued domain and overridden like any other domain.
+    """
+    def __init__(self, system: ConstraintSystem):
+        self.system = system
+        self.variables: FrozenSet[Variable] = frozenset(system.variables)
+        self.constraints: FrozenSet[Constraint] = frozenset(system.constraints)
+        self.objective: Optional[Expression] = system.objective
+        self.domain: Domain = {variable: set(values) for (variable, values) in system.domain.items()}
+
+        # Overrides are checked by identity, since a Variable's == builds a
+        # constraint and so cannot tell different variables apart.
+        self._ordered: Tuple[Variable, ...] = tuple(self.variables)
+        self._position: Dict[int, int] = {id(v): i for (i, v) in enumerate(self._ordered)}
+
+        # map of variables to the constraints that each belongs to
+        index: Dict[int, Set[Constraint]] = {id(v): set() for v in self._ordered}
+        for constraint in self.constraints:
+            for variable in constraint.variables:
+                index[id(variable)].add(constraint)
+        self.constraint_index: Dict[Variable, FrozenSet[Constraint]] = {
+            v: frozenset(index[id(v)]) for v in self._ordered
+        }
+
+    def __repr__(self):
+        return f"PreparedSystem with {len(self.variables)} variables and {len(self.constraints)} constraints"
+
+    def variant_domain(self, domain_overrides: Optional[Mapping[Variable, Iterable[Any]]] = None) -> Domain:
+        """Returns the domain of the system with the given variable domains replaced."""
+        domain = self.domain.copy()
+        for (variable, values) in (domain_overrides or {}).items():
+            domain[self._ordered[self._index_of(variable)]] = set(values)
+        return domain
+
+    def _index_of(self, variable: Variable) -> int:
+        if id(variable) not in self._position:
+            raise ValueError(f"{variable} is not a variable of the prepared system")
+        return self._position[id(variable)]
+
+    def solutions(self, domain_overrides: Optional[Mapping[Variable, Iterable[Any]]] = None) -> Iterator[Assignment]:
+        """Yields all solutions to the prepared system, with the given variable domains replaced."""
+        return _solutions(self, self.variant_domain(domain_overrides))
+
+    def optimize(self, domain_overrides: Optional[Mapping[Variable, Iterable[Any]]] = None) -> Iterator[Assignment]:
+        """Yields solutions to the prepared system with strictly decreasing objective value.
+
+        Implements branch-and-bound: any branch whose objective bounds, computed
+        from the current domains, show it cannot improve on the best solution
+        found so far is pruned. Values are tried in order of the objective bound
+        they give, so that good solutions are found early, and constraints are
+        checked against the bounds of their sides before they are fully
+        assigned, so that the promising but infeasible branches are cut short.
+        The last solution yielded is optimal.
+        """
+        if self.objective is None:
+            raise ValueError("the system has no objective")
+        objective = self.objective
+        best = None
+
+        def cannot_improve(domain: Domain) -> bool:
+            if best is None:
+                return False
+            bounds = objective.bounds(domain)
+            return bounds is not None and bounds[0] >= best
+
+        def most_promising(variable: Variable, domain: Domain) -> List[Any]:
+            def lower_bound(value: Any) -> Any:
+                variable.value = value
+                bounds = objective.bounds(domain)
+                return value if bounds is None else bounds[0]
+
+            values = sorted(domain[variable], key=lambda value: (lower_bound(value), value))
+            variable.value = None
+            return values
+
+        domain = self.variant_domain(domain_overrides)
+
+        # Among otherwise equal variables, branch first on those whose value
+        # moves the objective bound the most, since they decide the most pruning.
+        impact: Dict[Variable, Any] = {}
+        for variable in objective.variables:
+            bounds = [objective.bounds({**domain, variable: {value}}) for value in domain.get(variable, ())]
+            lower = [b[0] for b in bounds if b is not None]
+            if lower and len(lower) == len(bounds):
+                impact[variable] = max(lower) - min(lower)
+
+        for solution in _solutions(self, domain, cannot_improve, most_promising, impact, check_bounds=True):
+            value = objective.value()
+            if best is None or value < best:
+                best = value
+                yield solution
+
+    def search(self, domain_overrides: Optional[Mapping[Variable, Iterable[Any]]] = None) -> Optional[Assignment]:
+        """Returns a solution to the prepared system, or None if there is no solution."""
+        return next(self.solutions(domain_overrides), None)
+
+    def solve_many(self,
+                   domain_overrides: Iterable[Mapping[Variable, Iterable[Any]]],
+                   workers: int = 1) -> Iterator[Optional[Assignment]]:
+        """Yields a solution (or None) for each variant of the domain, in order.
+
+        With workers > 1 the variants are solved in a pool of forked processes
+        that share the prepared system, and results are streamed back as they
+        are completed. On platforms without fork, the variants are solved
+        sequentially.
+
+        Example:
+        >>> C = ConstraintSystem()
+        >>> x = C.variable_set
+        >>> C.add_constraint(x[0] + x[1] == x[2])
+        >>> for variable in C.variables:
+        ...     C.set_domain(variable, range(10))
+        ...
+        >>> P = prepare(C)
+        >>> for solution in P.solve_many([{x[2]: [n]} for n in range(3)]):
+        ...     print(solution[0] + solution[1] == solution[2])
+        ...
+        True
+        True
+        True
+        """
+        if workers <= 1 or 'fork' not in multiprocessing.get_all_start_methods():
+            for overrides in domain_overrides:
+                yield self.search(overrides)
+            return
+
+        # Variables are sent to the workers by position, since the constraints
+        # in each worker refer to that worker's copy of the variables.
+        indexed = (
+            {self._index_of(variable): set(values) for (variable, values) in overrides.items()}
+            for overrides in domain_overrides
+        )
+        with multiprocessing.get_context('fork').Pool(workers, initializer=_init_worker, initargs=(self, )) as pool:
+            yield from pool.imap(_search_variant, indexed)
+
+
+# Prepared system of a worker process of solve_many
+_prepared: Optional[PreparedSystem] = None
+
+
+def _init_worker(prepared: PreparedSystem):
+    global _prepared
+    _prepared = prepared
+
+
+def _search_variant(overrides: Dict[int, Set[Any]]) -> Optional[Assignment]:
+    assert _prepared is not None
+    return _prepared.search({_prepared._ordered[i]: values for (i, values) in overrides.items()})
+
+
+def prepare(system: ConstraintSystem) -> PreparedSystem:
+    """Compiles the constraint system for repeated solving over different domains."""
+    return PreparedSystem(system)
+
+
+def _solutions(prepared: PreparedSystem,
+               domain: Domain,
+               prune: Optional[Callable[[Domain], bool]] = None,
+               order: Optional[Callable[[Variable, Domain], List[Any]]] = None,
+               priority: Optional[Dict[Variable, Any]] = None,
+               check_bounds: bool = False) -> Iterator[Assignment]:
+    """Implements backtracking with domain reduction over the prepared system.
+
+    Branches for which prune returns True on the reduced domain are skipped.
+    The values of each branching variable are tried in the given order, or in
+    increasing order by default. Ties between branching variables are broken
+    by the highest priority. With check_bounds, a value is also skipped if the
+    bounds of a constraint on the variable show it cannot be satisfied.
     """
+    system = prepared.system
+    constraint_index = prepared.constraint_index
+
     def compatible_values(constraint: Constraint, variable: Variable, domain: Domain) -> Set[Any]:
         """Returns all values of the variable in its domain that satisfy the constraint.
         i.e. returns the reduced domain of the variable by excluding any values that violate the constraint.
@@ -61,18 +219,33 @@ def solutions(system: ConstraintSystem) -> Iterator[Assignment]:
                 constraint_map[variable].add(constraint)
         return constraint_map
 
-    def reduce_domain(unsatisfied: Set[Constraint],
-                      domain: Domain) -> Tuple[bool, Domain, Dict[Variable, Set[Constraint]]]:
+    def updated_constraints(constraint_map: Dict[Variable, Set[Constraint]],
+                            variable: Variable,
+                            unsatisfied: Set[Constraint]) -> Dict[Variable, Set[Constraint]]:
+        """Updates the accessible constraints after the variable has been assigned.
+        Only the constraints containing the variable can become accessible, so
+        these are looked up in the index rather than scanning all constraints.
+        """
+        updated: Dict[Variable, Set[Constraint]] = defaultdict(set)
+        for (v, constraints) in constraint_map.items():
+            if v is not variable:
+                updated[v] = constraints
+        for constraint in constraint_index[variable]:
+            if constraint not in unsatisfied:
+                continue
+            unassigned = constraint.unassigned_variables()
+            if len(unassigned) == 1:
+                updated[unassigned[0]] = updated[unassigned[0]] | {constraint}
+        return updated
+
+    def reduce_domain(constraint_map: Dict[Variable, Set[Constraint]], domain: Domain) -> Tuple[bool, Domain]:
         """Reduces the domain of each variable in the constraint system by
-        excluding values that violate the constraints.
+        excluding values that violate the accessible constraints, i.e. those
+        with only one unassigned variable.
         """
         reduced = domain.copy()
         prune = False
 
-        # Find all constraints that have only one unassigned variable
-        # If none are one variable away, no reductions are performed
-        constraint_map = accessible_constraints(unsatisfied)
-
         for (variable, constraints) in constraint_map.items():
             for constraint in constraints:
                 compatible = compatible_values(constraint, variable, reduced)
@@ -83,41 +256,114 @@ def solutions(system: ConstraintSystem) -> Iterator[Assignment]:
                     reduced[variable] = compatible
             if prune:
                 break
-        return prune, reduced, constraint_map
+        return prune, reduced
 
     def backtrack(fixed: Set[Variable],
                   unfixed: Set[Variable],
                   unsatisfied: Set[Constraint],
+                  constraint_map: Dict[Variable, Set[Constraint]],
                   domain: Domain) -> Iterator[Dict[Variable, Any]]:
-        if not unsatisfied:
+        if not unsatisfied and not unfixed:
             yield system.variable_set.values_dict()
         else:
-            prune, reduced_domain, constraint_map = reduce_domain(unsatisfied, domain)
-            if prune:
+            infeasible, reduced_domain = reduce_domain(constraint_map, domain)
+            if infeasible or (prune is not None and prune(reduced_domain)):
                 return
 
-            variable = max(unfixed, key=lambda v: len(constraint_map[v]))
-            constraints_to_check = constraint_map[variable]
+            if priority is None:
+                variable = max(unfixed, key=lambda v: len(constraint_map[v]))
+            else:
+                variable = max(unfixed, key=lambda v: (len(constraint_map[v]), priority.get(v, 0)))
+            remaining = unsatisfied - constraint_map[variable]
 
-            for value in sorted(reduced_domain[variable]):
+            values = sorted(reduced_domain[variable]) if order is None else order(variable, reduced_domain)
+            bounded = [c for c in constraint_index[variable] if c in remaining] if check_bounds else []
+
+            for value in values:
                 variable.value = value
+                if any(c.is_infeasible(reduced_domain) for c in bounded):
+                    continue
                 yield from backtrack(
                     fixed | {variable},
                     unfixed - {variable},
-                    unsatisfied - constraints_to_check,
+                    remaining,
+                    updated_constraints(constraint_map, variable, remaining),
                     reduced_domain,
                 )
             variable.value = None
 
     system.variable_set.reset()
+    unsatisfied = set(prepared.constraints)
     return backtrack(
         fixed=set(),
-        unfixed=set(system.variables),
-        unsatisfied=set(system.constraints),
-        domain=system.domain
+        unfixed=set(prepared.variables),
+        unsatisfied=unsatisfied,
+        constraint_map=accessible_constraints(unsatisfied),
+        domain=domain
     )
 
 
+def solutions(system: ConstraintSystem, expand_symmetries: bool = False) -> Iterator[Assignment]:
+    """Yields all solutions to the given constraint system.
+
+    Implements backtracking with domain reduction to find all solutions to the
+    constraint system. Declared symmetries of the system are broken, so only
+    representatives of each symmetry class are found, unless expand_symmetries
+    is set, in which case every image of these solutions is yielded as well.
+
+    Example:
+    >>> C = ConstraintSystem()
+    >>> x = C.variable_set
+    >>> C.add_constraints([
+    ...     x[0] < x[1],
+    ...     x[0]**2 + x[1]**2 == x[2]**2
+    ... ])
+    ...
+    >>> for variable in C.variables:
+    ...     C.set_domain(variable, range(1, 20))
+    ...
+    >>> for solution in all_solutions(C):
+    ...     print(solution)
+    ...
+    [3, 4, 5]
+    [6, 8, 10]
+    [5, 12, 13]
+    [9, 12, 15]
+    [8, 15, 17]
+    """
+    if not expand_symmetries or not system.symmetries:
+        return prepare(system).solutions()
+    return _expanded_solutions(system)
+
+
+def _expanded_solutions(system: ConstraintSystem) -> Iterator[Assignment]:
+    for solution in prepare(system).solutions():
+        images = system.symmetric_images(solution)
+        # Several members of a class can satisfy the lex-leader constraints,
+        # so the class is only expanded from its lexicographically least member.
+        if min(tuple(image.values()) for image in images) == tuple(solution.values()):
+            yield from images
+
+
+def optimize(system: ConstraintSystem) -> Iterator[Assignment]:
+    """Yields improving solutions to the given constraint system with respect to its objective.
+    The last solution yielded is optimal.
+
+    Example:
+    >>> C = ConstraintSystem()
+    >>> x = C.variable_set
+    >>> C.add_constraint(x[0] + x[1] == 10)
+    >>> for variable in C.variables:
+    ...     C.set_domain(variable, range(1, 10))
+    ...
+    >>> C.maximize(x[0] * x[1])
+    >>> *_, best = optimize(C)
+    >>> best[0] * best[1]
+    25
+    """
+    return prepare(system).optimize()
+
+
 def search(system: ConstraintSystem) -> Assignment:
     """Search for a solution to the given constraint system."""
     return next(solutions(system))
@@ -48,7 +48,24 @@ def greedy(system: ConstraintSystem, penalty_func='error'):
 def tabu(system: ConstraintSystem,
          max_iterations=1000,
          penalty_func='error',
-         alpha=0.6):
+         alpha=0.6,
+         objective_weight=1):
+    """Tabu search minimizing the total penalty of the violated constraints.
+
+    Returns the penalty of the best assignment found, which is 0 exactly when
+    the assignment is a solution, together with the assignment.
+
+    If the system has an objective, objective_weight times its value is added
+    to the cost used to choose moves, the variables of the objective are always
+    considered for moves, and the search runs for all max_iterations. The best
+    assignment is then the one with the lowest penalty, and among those the
+    lowest objective, so a solution is always preferred to a non-solution.
+    """
+    objective = system.objective
+
+    def objective_cost():
+        return 0 if objective is None else objective_weight * objective.value()
+
     # Initialize with random assignment
     for variable in system.variables:
         variable.value = random.choice(sorted(system.domain[variable]))
@@ -58,8 +75,8 @@ def tabu(system: ConstraintSystem,
 
     bad_variables: Dict[Variable, int] = defaultdict(int)
 
-    # Cost of our random assignment
-    cost = 0
+    # Penalty of our random assignment
+    total_penalty = 0
     for constraint in system.constraints:
         for variable in constraint.variables:
             constraints[variable].append(constraint)
@@ -68,12 +85,15 @@ def tabu(system: ConstraintSystem,
             continue
 
         penalty = constraint.penalty(method=penalty_func)
-        cost += penalty
+        total_penalty += penalty
         for v in constraint.variables:
             bad_variables[v] += penalty
 
     tabu: Dict[Tuple[Variable, Any], Any] = defaultdict(int)
 
+    cost = total_penalty + objective_cost()
+    best_penalty = total_penalty
+    best_objective = objective_cost()
     best_cost = cost
     best_assignment = system.variable_set.values_dict()
 
@@ -84,7 +104,13 @@ def tabu(system: ConstraintSystem,
         best_neighbor_cost = 10**100
         best_neighbors = []
 
-        for variable, old in bad_variables.items():
+        current_objective = objective_cost()
+        candidates = dict(bad_variables)
+        if objective is not None:
+            for variable in objective.variables:
+                candidates.setdefault(variable, 0)
+
+        for variable, old in candidates.items():
             original = variable.value
 
             for value in system.domain[variable]:
@@ -95,7 +121,7 @@ def tabu(system: ConstraintSystem,
                 ncost = cost - old + sum(
                     constraint.penalty(method=penalty_func)
                     for constraint in constraints[variable] if not constraint.is_satisfied()
-                )
+                ) + objective_cost() - current_objective
 
                 if tabu[variable, value] > iteration:
                     if ncost >= best_cost:
@@ -115,30 +141,35 @@ def tabu(system: ConstraintSystem,
 
         return variable, new_value, old_value, best_neighbor_cost
 
-    while iteration <= max_iterations and best_cost > 0:
+    while iteration <= max_iterations and (objective is not None or best_penalty > 0):
         iteration += 1
         try:
             (variable, new_value, old_value, cost) = best_neighbor(cost)
         except IndexError:
-            alpha *= (1 - best_cost/max_iterations)
+            alpha *= (1 - best_penalty/max_iterations)
             continue
 
         variable.value = new_value
 
-        tabu[variable, old_value] = iteration + alpha*cost + (iteration % 11)
-
         bad_variables.clear()
+        total_penalty = 0
         for constraint in system.constraints:
             if constraint.is_satisfied():
                 continue
 
             penalty = constraint.penalty(method=penalty_func)
+            total_penalty += penalty
             for v in constraint.variables:
                 bad_variables[v] += penalty
 
-        if cost < best_cost:
-            print(f"found {cost} on iteration {iteration - 1}/{max_iterations}")
+        # The tenure only depends on the penalty, since the objective can be negative
+        tabu[variable, old_value] = iteration + alpha*total_penalty + (iteration % 11)
+
+        if (total_penalty, objective_cost()) < (best_penalty, best_objective):
+            print(f"found {total_penalty} ({objective_cost()}) on iteration {iteration - 1}/{max_iterations}")
+            best_penalty = total_penalty
+            best_objective = objective_cost()
             best_cost = cost
             best_assignment = system.variable_set.values_dict()
 
-    return best_cost, best_assignment
+    return best_penalty, best_assignment
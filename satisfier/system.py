@@ -4,7 +4,11 @@ import itertools
 import numbers
 import operator
 
-from typing import Any, Callable, Dict, FrozenSet, Iterable, List, Set
+from typing import Any, Callable, Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+
+# Type aliases
+Bounds = Optional[Tuple[Any, Any]]
 
 
 class Variable:
@@ -38,7 +42,7 @@ class Variable:
 
     def __mul__(self, other):
         if isinstance(other, numbers.Number) and other == 1:
-            return
+            return Expression.to_expression(self)
         else:
             return operator.__mul__(Expression.to_expression(self), Expression.to_expression(other))
 
@@ -70,14 +74,71 @@ class Variable:
         return operator.__gt__(Expression.to_expression(self), Expression.to_expression(other))
 
 
+def _variable_bounds(variable: Variable, domain: Dict[Variable, Set[Any]]) -> Bounds:
+    """Returns the value of the variable, or the range of its domain, when these are real numbers."""
+    if variable.value is not None:
+        return (variable.value, variable.value) if isinstance(variable.value, numbers.Real) else None
+    values = domain.get(variable)
+    if not values or not all(isinstance(value, numbers.Real) for value in values):
+        return None
+    return min(values), max(values)
+
+
+def _negated_bounds(a: Bounds) -> Bounds:
+    if a is None:
+        return None
+    return -a[1], -a[0]
+
+
+def _sum_bounds(a: Bounds, b: Bounds) -> Bounds:
+    if a is None or b is None:
+        return None
+    return a[0] + b[0], a[1] + b[1]
+
+
+def _difference_bounds(a: Bounds, b: Bounds) -> Bounds:
+    if a is None or b is None:
+        return None
+    return a[0] - b[1], a[1] - b[0]
+
+
+def _product_bounds(a: Bounds, b: Bounds) -> Bounds:
+    if a is None or b is None:
+        return None
+    products = [x * y for x in a for y in b]
+    return min(products), max(products)
+
+
+def _power_bounds(a: Bounds, b: Bounds) -> Bounds:
+    """Returns bounds on a**b when b is a fixed non-negative integer."""
+    if a is None or b is None or b[0] != b[1] or not isinstance(b[0], numbers.Integral) or b[0] < 0:
+        return None
+    k = b[0]
+    powers = [a[0]**k, a[1]**k]
+    if a[0] <= 0 <= a[1]:
+        powers.append(0)
+    return min(powers), max(powers)
+
+
 class Expression:
     def __init__(self,
                  label: str,
                  variables: FrozenSet[Variable],
-                 value: Callable):
+                 value: Callable,
+                 bounds: Optional[Callable[[Dict[Variable, Set[Any]]], Bounds]] = None):
         self.label = label
         self.value = value
         self.variables = variables
+        self._bounds = bounds
+
+    def bounds(self, domain: Dict[Variable, Set[Any]]) -> Bounds:
+        """Returns lower and upper bounds on the value of the expression, given
+        the values of the assigned variables and the domains of the others.
+        Returns None if no bounds are known.
+        """
+        if self._bounds is None:
+            return None
+        return self._bounds(domain)
 
     @classmethod
     def to_expression(cls, thing) -> Expression:
@@ -88,6 +149,14 @@ class Expression:
                 label=thing.label,
                 variables=frozenset([thing]),
                 value=lambda: thing.value,
+                bounds=lambda domain: _variable_bounds(thing, domain),
+            )
+        elif isinstance(thing, numbers.Real):
+            return Expression(
+                label=str(thing),
+                variables=frozenset(),
+                value=lambda: thing,
+                bounds=lambda domain: (thing, thing)
             )
         else:
             return Expression(
@@ -103,7 +172,8 @@ class Expression:
         return Expression(
             label=f"-({self.label})",
             variables=self.variables,
-            value=lambda: -self.value()
+            value=lambda: -self.value(),
+            bounds=lambda domain: _negated_bounds(self.bounds(domain))
         )
 
     def __add__(self, other):
@@ -111,7 +181,8 @@ class Expression:
             return Expression(
                 label=f"{self.label} + {other.label}",
                 variables=self.variables | other.variables,
-                value=lambda: self.value() + other.value()
+                value=lambda: self.value() + other.value(),
+                bounds=lambda domain: _sum_bounds(self.bounds(domain), other.bounds(domain))
             )
         else:
             return self.__add__(Expression.to_expression(other))
@@ -124,17 +195,19 @@ class Expression:
             return Expression(
                 label=f"{self.label} - ({other.label})",
                 variables=self.variables | other.variables,
-                value=lambda: self.value() - other.value()
+                value=lambda: self.value() - other.value(),
+                bounds=lambda domain: _difference_bounds(self.bounds(domain), other.bounds(domain))
             )
         else:
-            return self.__add__(Expression.to_expression(other))
+            return self.__sub__(Expression.to_expression(other))
 
     def __mul__(self, other):
         if isinstance(other, Expression):
             return Expression(
                 label=f"({self.label})*({other.label})",
                 variables=self.variables | other.variables,
-                value=lambda: self.value() * other.value()
+                value=lambda: self.value() * other.value(),
+                bounds=lambda domain: _product_bounds(self.bounds(domain), other.bounds(domain))
             )
         else:
             return self.__mul__(Expression.to_expression(other))
@@ -147,7 +220,8 @@ class Expression:
             return Expression(
                 label=f"({self.label})**({other.label})",
                 variables=self.variables | other.variables,
-                value=lambda: self.value() ** other.value()
+                value=lambda: self.value() ** other.value(),
+                bounds=lambda domain: _power_bounds(self.bounds(domain), other.bounds(domain))
             )
         else:
             return self.__pow__(Expression.to_expression(other))
@@ -242,10 +316,119 @@ class Constraint:
     def is_violated(self) -> bool:
         return not self.is_satisfied()
 
+    def is_infeasible(self, domain: Dict[Variable, Set[Any]]) -> bool:
+        """Returns True if the bounds of the two sides, given the assigned values
+        and the domains of the other variables, show that the constraint cannot
+        be satisfied.
+        """
+        left = self.left.bounds(domain)
+        right = self.right.bounds(domain)
+        if left is None or right is None:
+            return False
+        if self.relation == operator.__le__:
+            return left[0] > right[1]
+        elif self.relation == operator.__lt__:
+            return left[0] >= right[1]
+        elif self.relation == operator.__ge__:
+            return left[1] < right[0]
+        elif self.relation == operator.__gt__:
+            return left[1] <= right[0]
+        elif self.relation == operator.__eq__:
+            return left[0] > right[1] or left[1] < right[0]
+        elif self.relation == operator.__ne__:
+            return left[0] == left[1] == right[0] == right[1]
+        return False
+
     def unassigned_variables(self) -> List[Variable]:
         return [v for v in self.variables if v.value is None]
 
 
+class Symmetry:
+    """A permutation of variables and values that maps solutions to solutions.
+
+    Each variable v in the support is sent to variable_map[v], and its value
+    a to value_map[a]; variables and values missing from the maps are fixed.
+    The support must be listed in the variable order of the system.
+    """
+    def __init__(self,
+                 variables: Iterable[Variable],
+                 variable_map: Dict[Variable, Variable],
+                 value_map: Dict[Any, Any],
+                 label: str):
+        self.variables: Tuple[Variable, ...] = tuple(variables)
+        self.variable_map = variable_map
+        self.value_map = value_map
+        self.label = label
+
+        # preimage[w] is the variable whose value is moved onto w
+        self._preimage: Dict[Variable, Variable] = {w: v for (v, w) in variable_map.items()}
+
+    def __repr__(self):
+        return f"{self.label}"
+
+    def image(self, values: Dict[Variable, Any]) -> Dict[Variable, Any]:
+        """Returns the image of the assignment under the symmetry."""
+        image = dict(values)
+        for variable in self.variables:
+            value = values[variable]
+            image[self.variable_map.get(variable, variable)] = self.value_map.get(value, value)
+        return image
+
+    def lex_leader(self) -> List[Constraint]:
+        """Returns constraints that only allow assignments that are lexicographically
+        no larger than their image under the symmetry.
+        """
+        support = self.variables
+
+        if not self.variable_map and len(self.value_map) == 2:
+            (a, b) = sorted(self.value_map)
+            if self.value_map[a] == b and self.value_map[b] == a:
+                return self._precedence(a, b)
+        preimage = [self._preimage.get(v, v) for v in support]
+
+        current = Expression(
+            label=f"({', '.join(v.label for v in support)})",
+            variables=frozenset(support),
+            value=lambda: tuple(v.value for v in support),
+        )
+        image = Expression(
+            label=f"{self.label}{current.label}",
+            variables=frozenset(support),
+            value=lambda: tuple(self.value_map.get(u.value, u.value) for u in preimage),
+        )
+        constraints = [Constraint(current, image, operator.__le__, f"{current.label} <= {image.label}")]
+
+        # Pure variable symmetries agree up to the first moved variable, so the
+        # first moved variable must be no larger than its preimage. This prunes
+        # long before the full lexicographic constraint can be checked.
+        if not self.value_map:
+            for (variable, source) in zip(support, preimage):
+                if variable is not source:
+                    constraints.append(variable <= source)
+                    break
+
+        return constraints
+
+    def _precedence(self, a: Any, b: Any) -> List[Constraint]:
+        """Returns the lex-leader constraints of the transposition of the values a < b.
+
+        An assignment is no larger than its image exactly when the first
+        variable taking a or b takes a, i.e. when b is only taken after a has
+        been. This is checked separately for each prefix of the support, so
+        that violations are found as soon as the prefix is assigned.
+        """
+        def preceded(variable: Variable, earlier: Tuple[Variable, ...]) -> Constraint:
+            label = f"{variable} == {b} implies {a} in ({', '.join(v.label for v in earlier)})"
+            condition = Expression(
+                label=label,
+                variables=frozenset(earlier + (variable, )),
+                value=lambda: variable.value != b or any(v.value == a for v in earlier),
+            )
+            return Constraint(condition, Expression.to_expression(True), operator.__eq__, label)
+
+        return [preceded(v, self.variables[:i]) for (i, v) in enumerate(self.variables)]
+
+
 class VariableSet:
     def __init__(self, label: str):
         self.label: str = label
@@ -284,6 +467,10 @@ class ConstraintSystem:
         self.variables: Set[Variable] = set()
         self.variable_set: VariableSet = VariableSet(label='x')
         self.domain: Dict[Variable, Set[Any]] = {}
+        self.symmetries: List[Symmetry] = []
+        self.symmetry_constraints: Set[Constraint] = set()
+        self.objective: Optional[Expression] = None
+        self._detected_symmetries = False
 
     def __repr__(self):
         cons = "\n".join([str(con) for con in self.constraints])
@@ -303,3 +490,129 @@ class ConstraintSystem:
     def all_different(self, variables: Iterable[Variable]):
         for (v1, v2) in itertools.combinations(variables, 2):
             self.add_constraint(v1 != v2)
+
+    def minimize(self, expression):
+        """Sets the objective of the system to minimizing the expression.
+        Symmetries from detect_symmetries generally change the objective, so
+        they cannot be combined with an objective.
+        """
+        if self._detected_symmetries:
+            raise ValueError("cannot set an objective after detect_symmetries has declared symmetries")
+        self.objective = Expression.to_expression(expression)
+        self.variables.update(self.objective.variables)
+
+    def maximize(self, expression):
+        """Sets the objective of the system to maximizing the expression.
+        The objective is stored as the negation of the expression, and is always minimized.
+        """
+        self.minimize(-Expression.to_expression(expression))
+
+    def _ordered(self, variables: Iterable[Variable]) -> List[Variable]:
+        """Returns the variables in the order they were created in the variable set."""
+        position = {id(v): i for (i, v) in enumerate(self.variable_set._map.values())}
+        return sorted(variables, key=lambda v: position[id(v)])
+
+    def add_symmetry(self, symmetry: Symmetry):
+        """Declares a symmetry of the system and adds its lex-leader constraints.
+
+        All declared symmetries are broken with respect to the same variable
+        order, so at least one solution from every symmetry class remains.
+        If the system has an objective, only symmetries that leave the objective
+        unchanged may be declared, or optimal solutions can be lost.
+        """
+        self.symmetries.append(symmetry)
+        constraints = symmetry.lex_leader()
+        self.symmetry_constraints.update(constraints)
+        self.add_constraints(constraints)
+
+    def variable_symmetry(self, permutation: Dict[Variable, Variable]):
+        """Declares that permuting the values of the variables according to the
+        given mapping sends solutions to solutions.
+        """
+        sources = {id(v) for v in permutation}
+        targets = {id(w) for w in permutation.values()}
+        if sources != targets or len(targets) != len(permutation):
+            raise ValueError(f"{permutation} is not a permutation of its variables")
+
+        permutation = {v: w for (v, w) in permutation.items() if v is not w}
+        if permutation:
+            support = self._ordered(set(permutation) | set(permutation.values()))
+            self.add_symmetry(Symmetry(support, permutation, {}, f"sigma{len(self.symmetries)}"))
+
+    def value_symmetry(self, variables: Iterable[Variable], permutation: Dict[Any, Any]):
+        """Declares that replacing the values of the variables according to the
+        given mapping sends solutions to solutions.
+        """
+        if set(permutation) != set(permutation.values()) or len(set(permutation.values())) != len(permutation):
+            raise ValueError(f"{permutation} is not a permutation of its values")
+
+        permutation = {a: b for (a, b) in permutation.items() if a != b}
+        if permutation:
+            support = self._ordered(set(variables))
+            self.add_symmetry(Symmetry(support, {}, permutation, f"pi{len(self.symmetries)}"))
+
+    def interchangeable_variables(self, variables: Iterable[Variable]):
+        """Declares that the values of the variables can be permuted arbitrarily."""
+        variables = self._ordered(set(variables))
+        for (v1, v2) in zip(variables, variables[1:]):
+            self.variable_symmetry({v1: v2, v2: v1})
+
+    def interchangeable_values(self, variables: Iterable[Variable], values: Iterable[Any]):
+        """Declares that the values can be permuted arbitrarily among the variables."""
+        variables = list(variables)
+        values = sorted(set(values))
+        for (a, b) in zip(values, values[1:]):
+            self.value_symmetry(variables, {a: b, b: a})
+
+    def detect_symmetries(self):
+        """Declares the value symmetries that are evident from the structure of the system.
+
+        If every constraint is an equality or inequality between two variables
+        and all variables have the same domain, as in graph coloring, then the
+        values are interchangeable. The constraints added to break previously
+        declared symmetries are not considered.
+
+        Nothing is detected if the system has an objective, since permuting
+        the values generally changes it.
+        """
+        if self.objective is not None:
+            return
+
+        def is_variable(expression: Expression) -> bool:
+            return len(expression.variables) == 1 and expression.label == next(iter(expression.variables)).label
+
+        relations = (operator.__eq__, operator.__ne__)
+        if not all(c.relation in relations and is_variable(c.left) and is_variable(c.right)
+                   for c in self.constraints - self.symmetry_constraints):
+            return
+
+        domains = [self.domain.get(v) for v in self.variables]
+        if domains and all(d is not None and d == domains[0] for d in domains):
+            declared = len(self.symmetries)
+            self.interchangeable_values(self.variables, domains[0])
+            self._detected_symmetries = self._detected_symmetries or len(self.symmetries) > declared
+
+    def symmetric_images(self, solution: Dict[Any, Any]) -> List[Dict[Any, Any]]:
+        """Returns all distinct images of the solution under the declared symmetries.
+
+        The solution is keyed as returned by VariableSet.values_dict.
+        """
+        keys = list(self.variable_set._map)
+        variables = list(self.variable_set._map.values())
+
+        def image(values: Tuple[Any, ...], symmetry: Symmetry) -> Tuple[Any, ...]:
+            mapped = symmetry.image(dict(zip(variables, values)))
+            return tuple(mapped[v] for v in variables)
+
+        start = tuple(solution[k] for k in keys)
+        seen = {start}
+        frontier = [start]
+        while frontier:
+            values = frontier.pop()
+            for symmetry in self.symmetries:
+                other = image(values, symmetry)
+                if other not in seen:
+                    seen.add(other)
+                    frontier.append(other)
+
+        return [dict(zip(keys, values)) for values in seen]
@@ -1,5 +1,27 @@
-from satisfier.enumerative import search, solutions
-from satisfier.system import ConstraintSystem
+import pytest
+
+from satisfier.enumerative import optimize, prepare, search, solutions
+from satisfier.system import Constraint, ConstraintSystem
+
+
+@pytest.fixture
+def constraint_checks(monkeypatch):
+    """Counts the constraint checks made, as a measure of the size of the search."""
+    checks = [0]
+    is_satisfied = Constraint.is_satisfied
+    is_infeasible = Constraint.is_infeasible
+
+    def counted_satisfied(self):
+        checks[0] += 1
+        return is_satisfied(self)
+
+    def counted_infeasible(self, domain):
+        checks[0] += 1
+        return is_infeasible(self, domain)
+
+    monkeypatch.setattr(Constraint, 'is_satisfied', counted_satisfied)
+    monkeypatch.setattr(Constraint, 'is_infeasible', counted_infeasible)
+    return checks
 
 
 def test_pythagorean_triple():
@@ -102,3 +124,293 @@ def test_latin_square():
 
     sols = list(solutions(C))
     assert len(sols) == 576
+
+
+def test_prepared_solve_many():
+    """Solves x + y == z for a range of fixed z, reusing the prepared system."""
+    C = ConstraintSystem()
+    x = C.variable_set
+
+    C.add_constraints([
+        x[0] < x[1],
+        x[0] + x[1] == x[2]
+    ])
+
+    for variable in C.variables:
+        C.set_domain(variable, range(10))
+
+    P = prepare(C)
+    overrides = [{x[2]: [n]} for n in range(6)]
+
+    sequential = list(P.solve_many(overrides))
+    parallel = list(P.solve_many(overrides, workers=2))
+
+    assert sequential[0] is None
+    for (n, solution) in enumerate(sequential[1:], 1):
+        assert solution[0] < solution[1]
+        assert solution[0] + solution[1] == solution[2] == n
+    assert parallel == sequential
+
+    assert len(list(P.solutions({x[2]: [7]}))) == 4
+    assert len(list(P.solutions())) == len(list(solutions(C)))
+
+
+def test_magic_square_symmetries():
+    """Enumerates the 3x3 magic squares up to rotation and reflection."""
+    C = ConstraintSystem()
+    x = C.variable_set
+    n = 3
+    target = n * (n**2 + 1) // 2
+
+    for i in range(n):
+        C.add_constraint(sum(x[n*i + j] for j in range(n)) == target)
+        C.add_constraint(sum(x[n*j + i] for j in range(n)) == target)
+    C.add_constraint(x[0] + x[4] + x[8] == target)
+    C.add_constraint(x[2] + x[4] + x[6] == target)
+    C.all_different(C.variables)
+
+    for variable in C.variables:
+        C.set_domain(variable, range(1, n**2 + 1))
+
+    # Rotations and reflections of the square, as maps of (row, column)
+    m = n - 1
+    transforms = [
+        lambda i, j: (j, m - i),
+        lambda i, j: (m - i, m - j),
+        lambda i, j: (m - j, i),
+        lambda i, j: (i, m - j),
+        lambda i, j: (m - i, j),
+        lambda i, j: (j, i),
+        lambda i, j: (m - j, m - i),
+    ]
+    for transform in transforms:
+        images = {(i, j): transform(i, j) for i in range(n) for j in range(n)}
+        C.variable_symmetry({x[n*i + j]: x[n*k + h] for ((i, j), (k, h)) in images.items()})
+
+    assert len(list(solutions(C))) == 1
+    assert len(list(solutions(C, expand_symmetries=True))) == 8
+
+
+def test_graph_coloring_symmetries():
+    """Counts the proper 3-colorings of a 5-cycle up to permutation of the colors."""
+    C = ConstraintSystem()
+    x = C.variable_set
+    n = 5
+
+    for i in range(n):
+        C.add_constraint(x[i] != x[(i + 1) % n])
+        C.set_domain(x[i], range(3))
+
+    C.detect_symmetries()
+
+    assert len(list(solutions(C))) == 5
+    assert len(list(solutions(C, expand_symmetries=True))) == 30
+
+
+def test_optimize_knapsack():
+    """Finds the most valuable selection of items that fits in a knapsack."""
+    C = ConstraintSystem()
+    x = C.variable_set
+
+    weights = [5, 4, 6, 3, 7, 2]
+    values = [10, 40, 30, 50, 35, 15]
+    capacity = 12
+
+    C.add_constraint(sum(w * x[i] for (i, w) in enumerate(weights)) <= capacity)
+    C.maximize(sum(v * x[i] for (i, v) in enumerate(values)))
+
+    for variable in C.variables:
+        C.set_domain(variable, [0, 1])
+
+    improving = [sum(v * s[i] for (i, v) in enumerate(values)) for s in optimize(C)]
+    assert improving == sorted(set(improving))
+
+    best = max(
+        sum(v * s[i] for (i, v) in enumerate(values))
+        for s in solutions(C)
+    )
+    assert improving[-1] == best == 105
+
+
+def test_optimize_unconstrained_objective_variable():
+    """Minimizes over a variable that appears only in the objective."""
+    C = ConstraintSystem()
+    x = C.variable_set
+
+    C.add_constraint(x[0] + x[1] == 7)
+    C.minimize((x[0] - x[2])**2 + x[1])
+
+    for i in range(3):
+        C.set_domain(x[i], range(-3, 8))
+
+    *_, best = optimize(C)
+    assert (best[0] - best[2])**2 + best[1] == 0
+
+
+def test_prepared_rejects_unknown_variables():
+    """Overrides for variables outside the system fail the same way with and without workers."""
+    C = ConstraintSystem()
+    x = C.variable_set
+
+    C.add_constraint(x[0] < x[1])
+    for variable in C.variables:
+        C.set_domain(variable, range(3))
+
+    P = prepare(C)
+    assert list(P.solve_many([{x[0]: [1]}], workers=2)) == [{0: 1, 1: 2}]
+
+    for workers in (1, 2):
+        with pytest.raises(ValueError):
+            list(P.solve_many([{x[5]: [0]}], workers=workers))
+
+
+def test_symmetries_must_be_permutations():
+    C = ConstraintSystem()
+    x = C.variable_set
+
+    C.add_constraint(x[0] != x[1])
+
+    with pytest.raises(ValueError):
+        C.variable_symmetry({x[0]: x[1]})
+    with pytest.raises(ValueError):
+        C.value_symmetry([x[0], x[1]], {0: 1, 1: 1})
+    assert not C.symmetries
+
+
+def test_value_symmetries_prune_search(constraint_checks):
+    """Breaking color symmetry shrinks the search, not just the number of solutions."""
+    def coloring(detect):
+        C = ConstraintSystem()
+        x = C.variable_set
+        n = 8
+
+        for i in range(n):
+            C.add_constraint(x[i] != x[(i + 1) % n])
+            C.add_constraint(x[i] != x[(i + 3) % n])
+            C.set_domain(x[i], range(4))
+
+        if detect:
+            C.detect_symmetries()
+        return C
+
+    counts = []
+    for detect in (False, True):
+        constraint_checks[0] = 0
+        C = coloring(detect)
+        counts.append((len(list(solutions(C))), constraint_checks[0]))
+
+    ((all_count, all_checks), (broken_count, broken_checks)) = counts
+    assert broken_count < all_count == len(list(solutions(coloring(True), expand_symmetries=True)))
+    assert broken_checks * 4 < all_checks
+
+
+def test_optimize_difference():
+    """Subtracting a variable from an expression is not treated as addition."""
+    C = ConstraintSystem()
+    x = C.variable_set
+
+    C.add_constraint(x[0] != x[1])
+    C.minimize(2 * x[0] - x[1] - 1)
+
+    for variable in C.variables:
+        C.set_domain(variable, range(4))
+
+    *_, best = optimize(C)
+    assert (best[0], best[1]) == (0, 3)
+    assert 2 * best[0] - best[1] - 1 == -4
+
+
+def test_optimize_ignores_detected_symmetries():
+    """Value symmetries change the objective, so they are not detected when optimizing."""
+    C = ConstraintSystem()
+    x = C.variable_set
+
+    C.add_constraint(x[0] != x[1])
+    for variable in C.variables:
+        C.set_domain(variable, range(3))
+
+    C.minimize(x[0] + 2 * x[1])
+    C.detect_symmetries()
+    assert not C.symmetries
+
+    *_, best = optimize(C)
+    assert best[0] + 2 * best[1] == 1
+
+    D = ConstraintSystem()
+    y = D.variable_set
+
+    D.add_constraint(y[0] != y[1])
+    for variable in D.variables:
+        D.set_domain(variable, range(3))
+
+    D.detect_symmetries()
+    with pytest.raises(ValueError):
+        D.minimize(y[0] + 2 * y[1])
+
+
+def test_optimize_prunes_search(constraint_checks):
+    """Branch-and-bound checks far fewer constraints than enumerating every solution."""
+    weights = [12, 7, 11, 8, 9, 6, 13, 5, 10, 4, 14, 3]
+    values = [24, 13, 23, 15, 16, 11, 29, 8, 19, 6, 31, 5]
+    capacity = sum(weights) // 2
+
+    def knapsack():
+        C = ConstraintSystem()
+        x = C.variable_set
+
+        C.add_constraint(sum(w * x[i] for (i, w) in enumerate(weights)) <= capacity)
+        C.maximize(sum(v * x[i] for (i, v) in enumerate(values)))
+
+        for variable in C.variables:
+            C.set_domain(variable, [0, 1])
+        return C
+
+    best = max(sum(v * s[i] for (i, v) in enumerate(values)) for s in solutions(knapsack()))
+    enumerated = constraint_checks[0]
+
+    constraint_checks[0] = 0
+    *_, solution = optimize(knapsack())
+    assert sum(v * solution[i] for (i, v) in enumerate(values)) == best
+    assert constraint_checks[0] * 3 < enumerated
+
+
+def test_optimize_non_numeric_domain():
+    """Variables over non-numeric domains have no bounds, so no feasible branch is cut."""
+    C = ConstraintSystem()
+    x = C.variable_set
+
+    C.add_constraint(x[0] + x[1] == x[2])
+    C.set_domain(x[0], ['a', 'ab'])
+    C.set_domain(x[1], ['c', 'b'])
+    C.set_domain(x[2], ['abc', 'ac'])
+    C.add_constraint(x[3] >= 0)
+    C.set_domain(x[3], range(3))
+    C.minimize(x[3])
+
+    assert (x[0] + x[1]).bounds(C.domain) is None
+
+    *_, best = optimize(C)
+    assert best[0] + best[1] == best[2]
+    assert best[3] == 0
+
+
+def test_detect_symmetries_after_declared_symmetries():
+    """Colors are still detected as interchangeable after a rotation has been declared."""
+    def rotated_cycle(detect):
+        C = ConstraintSystem()
+        x = C.variable_set
+        n = 5
+
+        for i in range(n):
+            C.add_constraint(x[i] != x[(i + 1) % n])
+            C.set_domain(x[i], range(3))
+
+        C.variable_symmetry({x[i]: x[(i + 1) % n] for i in range(n)})
+        if detect:
+            C.detect_symmetries()
+        return C
+
+    C = rotated_cycle(True)
+    assert C.symmetries[1:]
+    assert len(list(solutions(C))) < len(list(solutions(rotated_cycle(False))))
+    assert len(list(solutions(C, expand_symmetries=True))) == 30
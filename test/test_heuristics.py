@@ -0,0 +1,29 @@
+import random
+
+from satisfier.heuristics import tabu
+from satisfier.system import ConstraintSystem
+
+
+def test_tabu_knapsack():
+    """Maximizes the value of a knapsack, only returning selections that fit."""
+    weights = [5, 4, 6, 3, 7, 2]
+    values = [10, 40, 30, 50, 35, 15]
+    capacity = 12
+
+    for seed in range(3):
+        random.seed(seed)
+
+        C = ConstraintSystem()
+        x = C.variable_set
+
+        C.add_constraint(sum(w * x[i] for (i, w) in enumerate(weights)) <= capacity)
+        C.maximize(sum(v * x[i] for (i, v) in enumerate(values)))
+
+        for variable in C.variables:
+            C.set_domain(variable, [0, 1])
+
+        penalty, solution = tabu(C, max_iterations=200, objective_weight=0.01)
+
+        assert penalty == 0
+        assert sum(w * solution[i] for (i, w) in enumerate(weights)) <= capacity
+        assert sum(v * solution[i] for (i, v) in enumerate(values)) == 105